@@ -0,0 +1,259 @@
+from ._native import ffi
+from .device import PciDevice, PciFillFlag, PciCap, PciCapType, PciCapId, PciExtCapId, PciClass
+from typing import NamedTuple, List, Optional, Callable, Union
+import hashlib
+import json
+import os
+import tempfile
+from . import pci
+
+
+_CACHE_VERSION = 1
+
+_SYSFS_DEVICES = '/sys/bus/pci/devices'
+
+_BOOT_ID = '/proc/sys/kernel/random/boot_id'
+
+
+
+def _default_cache_dir() -> str:
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'pypci')
+
+
+def _default_id_file_name() -> str:
+    # only pci_alloc/pci_init; the bus is not scanned
+    p = pci.Pci()
+    try:
+        return p.id_file_name
+    finally:
+        p.close()
+
+
+def _make_cap(id: int, type: int, addr: int) -> PciCap:
+    try:
+        if type == PciCapType.Normal.value:
+            return PciCap(PciCapId(id), PciCapType.Normal, addr)
+        elif type == PciCapType.Extended.value:
+            return PciCap(PciExtCapId(id), PciCapType.Extended, addr)
+    except ValueError:
+        pass
+    return PciCap(id, PciCapType(type), addr)
+
+
+class CachedPciDevice(NamedTuple):
+    domain: int
+    bus: int
+    dev: int
+    func: int
+    known_fields: PciFillFlag
+    vendor_id: Optional[int] = None
+    device_id: Optional[int] = None
+    device_class: Optional[Union[int, PciClass]] = None
+    irq: Optional[int] = None
+    base_addr: Optional[List[int]] = None
+    size: Optional[List[int]] = None
+    rom_base_addr: Optional[int] = None
+    rom_size: Optional[int] = None
+    caps: Optional[List[PciCap]] = None
+    phy_slot: Optional[str] = None
+    module_alias: Optional[str] = None
+    label: Optional[str] = None
+    vendor: Optional[str] = None
+    device: Optional[str] = None
+    device_class_name: Optional[str] = None
+
+    @property
+    def slot(self) -> str:
+        return f'{self.domain:04x}:{self.bus:02x}:{self.dev:02x}.{self.func:x}'
+
+    @classmethod
+    def from_device(cls, device: PciDevice, lookup: bool = True) -> 'CachedPciDevice':
+        """Snapshot the fields already known to ``device``; never triggers another fill."""
+        known = device.known_fields
+        flags = PciFillFlag.__members__
+        info = {}
+
+        def has(flag: str) -> bool:
+            return flag in flags and getattr(PciFillFlag, flag) in known
+
+        if has('Ident'):
+            info.update(vendor_id=device.vendor_id, device_id=device.device_id)
+            if lookup:
+                info.update(vendor=device.vendor, device=device.device)
+        if has('Class'):
+            try:
+                info.update(device_class=device.device_class)
+            except ValueError:
+                info.update(device_class=device._dev.device_class)
+            if lookup:
+                info.update(device_class_name=device._pci.lookup(class_id=device._dev.device_class).pci_class)
+        if has('Irq'):
+            info.update(irq=device.irq)
+        if has('Bases'):
+            info.update(base_addr=device.base_addr)
+        if has('RomBase'):
+            info.update(rom_base_addr=device.rom_base_addr)
+        if has('Sizes'):
+            info.update(size=device.size, rom_size=device.rom_size)
+        if has('Caps') or has('ExtCaps'):
+            # walk the list directly: PciDevice.caps would fill whichever of Caps/ExtCaps is missing
+            caps = []
+            cap = device._dev.first_cap
+            while cap != ffi.NULL:
+                caps.append(_make_cap(cap.id, cap.type, cap.addr))
+                cap = cap.next
+            info.update(caps=caps)
+        if has('PhysSlot'):
+            info.update(phy_slot=device.phy_slot)
+        if has('ModuleAlias'):
+            info.update(module_alias=device.module_alias)
+        if has('Label'):
+            info.update(label=device.label)
+
+        return cls(device.domain, device.bus, device.dev, device.func, known, **info)
+
+    def to_json(self) -> dict:
+        ret = self._asdict()
+        ret['known_fields'] = int(self.known_fields)
+        if self.device_class is not None:
+            ret['device_class'] = int(self.device_class)
+        if self.caps is not None:
+            ret['caps'] = [(int(cap.id), cap.type.value, cap.addr) for cap in self.caps]
+        return ret
+
+    @classmethod
+    def from_json(cls, data: dict) -> 'CachedPciDevice':
+        data = dict(data)
+        data['known_fields'] = PciFillFlag(data['known_fields'])
+        if data.get('device_class') is not None:
+            try:
+                data['device_class'] = PciClass(data['device_class'])
+            except ValueError:
+                pass
+        if data.get('caps') is not None:
+            data['caps'] = [_make_cap(*cap) for cap in data['caps']]
+        return cls(**data)
+
+
+class PciCache:
+    """Persistent on-disk cache of scan_bus/fill_info results and resolved names.
+
+    The cache is keyed by a fingerprint made of the sysfs device entries (names
+    and ctimes), the kernel boot id and the pci.ids mtime, so a warm start only
+    reads the cache file and never scans the bus. Unless ``id_file_name`` is
+    given, libpci's default ID database is used and its path is taken from a
+    freshly initialized access.
+
+    Resources that the kernel may change without adding, removing or replacing
+    a device (``Irq`` when a driver switches to MSI, ``Bases``/``Sizes``/``RomBase``
+    on reassignment) are only revalidated on reboot or hotplug; pass ``flags``
+    without them, or call :meth:`invalidate`, if they must always be current.
+    """
+
+    def __init__(self, cache_dir: Optional[str] = None, flags: PciFillFlag = PciFillFlag.All,
+                 lookup: bool = True, id_file_name: Optional[str] = None,
+                 sysfs_path: str = _SYSFS_DEVICES):
+        self.cache_dir = _default_cache_dir() if cache_dir is None else cache_dir
+        self.flags = flags
+        self.lookup = lookup
+        self._explicit_id_file_name = id_file_name is not None
+        self.id_file_name = id_file_name if id_file_name is not None or not lookup else _default_id_file_name()
+        self.sysfs_path = sysfs_path
+
+    @property
+    def path(self) -> str:
+        return os.path.join(self.cache_dir, f'scan-{int(self.flags):x}{"-names" if self.lookup else ""}.json')
+
+    def fingerprint(self) -> Optional[str]:
+        try:
+            # a card replaced in the same slot keeps the name but recreates the entry
+            with os.scandir(self.sysfs_path) as it:
+                listing = sorted(f'{entry.name}@{entry.stat(follow_symlinks=False).st_ctime_ns}'
+                                 for entry in it)
+        except OSError:
+            return None
+        h = hashlib.sha1()
+        h.update(f'{_CACHE_VERSION}\0{int(self.flags)}\0{self.lookup}\0'.encode('utf-8'))
+        h.update('\0'.join(listing).encode('utf-8'))
+        try:
+            with open(_BOOT_ID, 'r') as f:
+                h.update(f'\0{f.read().strip()}'.encode('utf-8'))
+        except OSError:
+            pass
+        if self.lookup and self.id_file_name is not None:
+            try:
+                st = os.stat(self.id_file_name)
+                h.update(f'\0{self.id_file_name}\0{st.st_mtime_ns}\0{st.st_size}'.encode('utf-8'))
+            except OSError:
+                h.update(f'\0{self.id_file_name}\0-'.encode('utf-8'))
+        return h.hexdigest()
+
+    def load(self, fingerprint: Optional[str] = None) -> Optional[List[CachedPciDevice]]:
+        if fingerprint is None:
+            fingerprint = self.fingerprint()
+        if fingerprint is None:
+            return None
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') != _CACHE_VERSION or data.get('fingerprint') != fingerprint:
+                return None
+            return [CachedPciDevice.from_json(dev) for dev in data['devices']]
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def store(self, devices: List[CachedPciDevice], fingerprint: Optional[str] = None):
+        if fingerprint is None:
+            fingerprint = self.fingerprint()
+        if fingerprint is None:
+            return
+        data = dict(version=_CACHE_VERSION, fingerprint=fingerprint,
+                    devices=[dev.to_json() for dev in devices])
+        os.makedirs(self.cache_dir, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(prefix='.scan-', dir=self.cache_dir)
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(data, f)
+            os.replace(tmp, self.path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def scan(self, pci: 'pci.Pci') -> List[CachedPciDevice]:
+        """Snapshot every device of ``pci``, scanning the bus only if it was not scanned yet."""
+        if self._explicit_id_file_name:
+            pci.id_file_name = self.id_file_name
+        # pci_scan_bus appends to the device list, so never scan an access twice
+        if pci._pacc.devices == ffi.NULL:
+            pci.scan_bus()
+        ret = []
+        for device in pci.devices:
+            device.fill_info(self.flags)
+            ret.append(CachedPciDevice.from_device(device, self.lookup))
+        return ret
+
+    def invalidate(self):
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+    def devices(self, pci_factory: Optional[Callable[[], 'pci.Pci']] = None) -> List[CachedPciDevice]:
+        """Return cached devices, rescanning through libpci only when the fingerprint changed."""
+        fingerprint = self.fingerprint()
+        ret = self.load(fingerprint)
+        if ret is not None:
+            return ret
+
+        p = pci.Pci() if pci_factory is None else pci_factory()
+        try:
+            ret = self.scan(p)
+        finally:
+            if pci_factory is None:
+                p.close()
+        try:
+            self.store(ret, fingerprint)
+        except OSError:
+            pass
+        return ret
@@ -0,0 +1,200 @@
+from .pci import Pci, PciLookupMode
+from .device import PciDevice, PciFillFlag, PciCapType, _rstrip
+from .filter import PciFilter
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Sequence, TextIO, Tuple
+import argparse
+import csv
+import json
+import os
+import sys
+
+
+class _NameCache:
+    """Memoizes pci.ids lookups so each vendor/device/class is resolved once per run."""
+
+    def __init__(self, pci: Pci):
+        self._pci = pci
+        self._cache: Dict[Tuple[int, ...], Optional[str]] = {}
+
+    def _lookup(self, flags: PciLookupMode, *args: int) -> Optional[str]:
+        key = (flags.value,) + args
+        try:
+            return self._cache[key]
+        except KeyError:
+            ret = self._cache[key] = self._pci.lookup_name(flags, *args)
+            return ret
+
+    def vendor(self, vendor_id: int) -> Optional[str]:
+        return self._lookup(PciLookupMode.Vendor, vendor_id)
+
+    def device(self, vendor_id: int, device_id: int) -> Optional[str]:
+        return self._lookup(PciLookupMode.Device, vendor_id, device_id)
+
+    def pci_class(self, class_id: int) -> Optional[str]:
+        return self._lookup(PciLookupMode.Class, class_id)
+
+
+class _Field(NamedTuple):
+    flag: Optional[str]
+    get: Callable[[PciDevice, _NameCache], Any]
+    text: Callable[[Any], str] = str
+
+
+def _hex(width: int) -> Callable[[int], str]:
+    return lambda x: f'{x:0{width}x}'
+
+
+def _hex_list(xs: List[int]) -> str:
+    return ','.join(hex(x) for x in xs)
+
+
+def _opt(x: Optional[str]) -> str:
+    return '' if x is None else x
+
+
+def _caps(dev: PciDevice, names: _NameCache) -> List[str]:
+    return [f'{"ext:" if cap.type == PciCapType.Extended else ""}{int(cap.id):02x}@{cap.addr:03x}'
+            for cap in dev.caps]
+
+
+FIELDS: Dict[str, _Field] = {
+    'slot': _Field(None, lambda d, n: f'{d.domain:04x}:{d.bus:02x}:{d.dev:02x}.{d.func:x}'),
+    'class_id': _Field('Class', lambda d, n: d._dev.device_class, _hex(4)),
+    'class': _Field('Class', lambda d, n: n.pci_class(d._dev.device_class), _opt),
+    'vendor_id': _Field('Ident', lambda d, n: d._dev.vendor_id, _hex(4)),
+    'device_id': _Field('Ident', lambda d, n: d._dev.device_id, _hex(4)),
+    'vendor': _Field('Ident', lambda d, n: n.vendor(d._dev.vendor_id), _opt),
+    'device': _Field('Ident', lambda d, n: n.device(d._dev.vendor_id, d._dev.device_id), _opt),
+    'irq': _Field('Irq', lambda d, n: d._dev.irq),
+    'bases': _Field('Bases', lambda d, n: list(_rstrip(d._dev.base_addr, lambda x: x == 0)), _hex_list),
+    'sizes': _Field('Sizes', lambda d, n: list(_rstrip(d._dev.size, lambda x: x == 0)), _hex_list),
+    'rom_base': _Field('RomBase', lambda d, n: d._dev.rom_base_addr, hex),
+    'rom_size': _Field('Sizes', lambda d, n: d._dev.rom_size, hex),
+    'caps': _Field('Caps', _caps, ','.join),
+    'phys_slot': _Field('PhysSlot', lambda d, n: d.phy_slot, _opt),
+    'module_alias': _Field('ModuleAlias', lambda d, n: d.module_alias, _opt),
+    'label': _Field('Label', lambda d, n: d.label, _opt),
+}
+
+DEFAULT_FIELDS = ('slot', 'class', 'vendor', 'device', 'vendor_id', 'device_id')
+
+
+def fill_flags(fields: Sequence[str]) -> PciFillFlag:
+    """Only the PciFillFlags needed to produce ``fields``."""
+    members = PciFillFlag.__members__
+    flags = PciFillFlag(0)
+    for name in fields:
+        flag = FIELDS[name].flag
+        if flag is not None and flag in members:
+            flags |= members[flag]
+            if flag == 'Caps' and 'ExtCaps' in members:
+                flags |= members['ExtCaps']
+    return flags
+
+
+def records(pci: Pci, fields: Sequence[str] = DEFAULT_FIELDS, slot_filter: Optional[str] = None,
+            id_filter: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """Yield one record per matching device as the bus list is walked.
+
+    Filters are parsed before returning, so malformed ``slot_filter``/``id_filter``
+    raise ValueError here rather than on first iteration.
+    """
+    filt = pci.filter()
+    if slot_filter is not None:
+        filt.slot_filter = slot_filter
+    if id_filter is not None:
+        filt.id_filter = id_filter
+    return _records(pci, fields, filt)
+
+
+def _records(pci: Pci, fields: Sequence[str], filt: PciFilter) -> Iterator[Dict[str, Any]]:
+    flags = fill_flags(fields)
+    names = _NameCache(pci)
+    getters = [(name, FIELDS[name].get) for name in fields]
+
+    pci.scan_bus()
+    for dev in pci.devices:
+        if dev not in filt:
+            continue
+        if flags:
+            dev.fill_info(flags)
+        yield dict((name, get(dev, names)) for name, get in getters)
+
+
+def _write_text(out: TextIO, fields: Sequence[str], recs: Iterator[Dict[str, Any]]):
+    texts = [(name, FIELDS[name].text) for name in fields]
+    for rec in recs:
+        out.write('\t'.join(text(rec[name]) for name, text in texts))
+        out.write('\n')
+        out.flush()
+
+
+def _write_json(out: TextIO, fields: Sequence[str], recs: Iterator[Dict[str, Any]]):
+    for rec in recs:
+        out.write(json.dumps(rec))
+        out.write('\n')
+        out.flush()
+
+
+def _write_csv(out: TextIO, fields: Sequence[str], recs: Iterator[Dict[str, Any]]):
+    texts = [(name, FIELDS[name].text) for name in fields]
+    writer = csv.writer(out)
+    writer.writerow(fields)
+    out.flush()
+    for rec in recs:
+        writer.writerow([text(rec[name]) for name, text in texts])
+        out.flush()
+
+
+_WRITERS = {
+    'text': _write_text,
+    'json': _write_json,
+    'csv': _write_csv,
+}
+
+
+def _parse_fields(val: str) -> List[str]:
+    ret = [x.strip() for x in val.split(',') if x.strip()]
+    for name in ret:
+        if name not in FIELDS:
+            raise argparse.ArgumentTypeError(f'unknown field {name!r} (choose from {", ".join(FIELDS)})')
+    return ret
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog='pypci', description='List PCI devices')
+    parser.add_argument('-s', dest='slot', metavar='[[[[<domain>]:]<bus>]:][<slot>][.[<func>]]',
+                        help='show only devices in the selected slots')
+    parser.add_argument('-d', dest='id', metavar='[<vendor>]:[<device>]',
+                        help='show only devices with the specified IDs')
+    parser.add_argument('-f', '--fields', type=_parse_fields, default=list(DEFAULT_FIELDS),
+                        help=f'comma-separated fields to print (default: {",".join(DEFAULT_FIELDS)}; '
+                             f'available: {",".join(FIELDS)})')
+    parser.add_argument('-o', '--format', choices=sorted(_WRITERS), default='text',
+                        help='output format (json is JSON Lines)')
+    parser.add_argument('-i', dest='id_file_name', metavar='<file>', help='use specified ID database')
+    args = parser.parse_args(argv)
+
+    pci = Pci()
+    try:
+        if args.id_file_name is not None:
+            pci.id_file_name = args.id_file_name
+        try:
+            recs = records(pci, args.fields, args.slot, args.id)
+        except ValueError as e:
+            parser.error(str(e))
+        try:
+            _WRITERS[args.format](sys.stdout, args.fields, recs)
+        finally:
+            # release the device held by the suspended generator before pci_cleanup
+            recs.close()
+    except BrokenPipeError:
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return 1
+    finally:
+        pci.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -279,30 +279,33 @@ class PciDevice:
     def __repr__(self):
         info = [f'{self.domain:04x}:{self.bus:02x}:{self.dev:02x}.{self.func:02x}']
         flags = PciFillFlag.__members__
+        known = self.known_fields
+        dev = self._dev
 
-        if 'Ident' in flags and PciFillFlag.Ident in self.known_fields:
+        def has(flag: str) -> bool:
+            return flag in flags and getattr(PciFillFlag, flag) in known
+
+        if has('Ident'):
             info.append(f', {{{self.vendor} {self.device}}}')
-            info.append(f', vendor_id=0x{self.vendor_id:04x}, device_id=0x{self.device_id:04x}')
-        if 'Irq' in flags and PciFillFlag.Irq in self.known_fields:
-            info.append(f', irq={self.irq}')
-        if 'Bases' in flags and PciFillFlag.Bases in self.known_fields:
-            info.append(f', bases=[{", ".join(list(hex(addr) for addr in self.base_addr))}]')
-        if 'RomBase' in flags and PciFillFlag.RomBase in self.known_fields:
-            info.append(f', rom_base={hex(self.rom_base_addr)}')
-        if 'Sizes' in flags and PciFillFlag.Sizes in self.known_fields:
-            info.append(f', size=[{", ".join(list(hex(size) for addr in self.sizes))}]')
-            info.append(f', rom_size={hex(self.rom_size)}')
-        if 'Class' in flags and PciFillFlag.Class in self.known_fields:
-            info.append(f', device_class={self.device_class_name}')
-        if ('Caps' in flags and PciFillFlag.Caps in self.known_fields) or\
-           ('ExtCaps' in flags and PciFillFlag.ExtCaps in self.known_fields):
+            info.append(f', vendor_id=0x{dev.vendor_id:04x}, device_id=0x{dev.device_id:04x}')
+        if has('Irq'):
+            info.append(f', irq={dev.irq}')
+        if has('Bases'):
+            info.append(f', bases=[{", ".join(hex(addr) for addr in _rstrip(dev.base_addr, lambda x: x == 0))}]')
+        if has('RomBase'):
+            info.append(f', rom_base={hex(dev.rom_base_addr)}')
+        if has('Sizes'):
+            info.append(f', size=[{", ".join(hex(size) for size in _rstrip(dev.size, lambda x: x == 0))}]')
+            info.append(f', rom_size={hex(dev.rom_size)}')
+        if has('Class'):
+            info.append(f', device_class={self._pci.lookup(class_id=dev.device_class).pci_class}')
+        if has('Caps') or has('ExtCaps'):
             info.append(f', caps={self.caps}')
-        if 'PhysSlot' in flags and PciFillFlag.PhysSlot in self.known_fields:
+        if has('PhysSlot'):
             info.append(f', phys_slot={repr(self.phy_slot)}')
-        if 'ModuleAlias' in flags and PciFillFlag.ModuleAlias in self.known_fields:
+        if has('ModuleAlias'):
             info.append(f', module_alias={repr(self.module_alias)}')
-        if 'Label' in flags and PciFillFlag.Label in self.known_fields:
+        if has('Label'):
             info.append(f', label={repr(self.label)}')
 
         return f'<{self.__class__.__module__}.{self.__class__.__name__}: {"".join(info)}>'
-
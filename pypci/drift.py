@@ -0,0 +1,300 @@
+"""Config-space drift detection across snapshots and hosts.
+
+Snapshots hold N config spaces as an ``(N, size)`` ``uint8`` array. Diffs are a
+masked XOR over all aligned rows of a chunk of hosts at once; only the resulting
+changed offsets are mapped back to register names via the capability chain.
+
+Requires numpy (``pip install pypci[drift]``).
+"""
+from ._native import lib
+from .device import PciCapId, PciExtCapId
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple, Union
+import struct
+import numpy as np
+from . import pci
+
+
+CONFIG_SPACE_SIZE = 4096
+
+_HEADER = (
+    (0x00, 2, 'vendor_id'), (0x02, 2, 'device_id'), (0x04, 2, 'command'), (0x06, 2, 'status'),
+    (0x08, 1, 'revision_id'), (0x09, 3, 'class'), (0x0c, 1, 'cache_line_size'),
+    (0x0d, 1, 'latency_timer'), (0x0e, 1, 'header_type'), (0x0f, 1, 'bist'),
+    (0x34, 1, 'capabilities_pointer'), (0x3c, 1, 'interrupt_line'), (0x3d, 1, 'interrupt_pin'),
+)
+
+_HEADER_NORMAL = (
+    (0x10, 4, 'bar0'), (0x14, 4, 'bar1'), (0x18, 4, 'bar2'), (0x1c, 4, 'bar3'), (0x20, 4, 'bar4'),
+    (0x24, 4, 'bar5'), (0x28, 4, 'cardbus_cis'), (0x2c, 2, 'subsystem_vendor_id'),
+    (0x2e, 2, 'subsystem_id'), (0x30, 4, 'rom_address'), (0x3e, 1, 'min_gnt'), (0x3f, 1, 'max_lat'),
+)
+
+_HEADER_BRIDGE = (
+    (0x10, 4, 'bar0'), (0x14, 4, 'bar1'), (0x18, 1, 'primary_bus'), (0x19, 1, 'secondary_bus'),
+    (0x1a, 1, 'subordinate_bus'), (0x1b, 1, 'sec_latency_timer'), (0x1c, 1, 'io_base'),
+    (0x1d, 1, 'io_limit'), (0x1e, 2, 'sec_status'), (0x20, 2, 'memory_base'), (0x22, 2, 'memory_limit'),
+    (0x24, 2, 'pref_memory_base'), (0x26, 2, 'pref_memory_limit'), (0x28, 4, 'pref_base_upper32'),
+    (0x2c, 4, 'pref_limit_upper32'), (0x30, 2, 'io_base_upper16'), (0x32, 2, 'io_limit_upper16'),
+    (0x38, 4, 'rom_address'), (0x3e, 2, 'bridge_control'),
+)
+
+_CAP_REGS: Dict[Tuple[bool, int], Tuple[Tuple[int, int, str], ...]] = {
+    (False, lib.PCI_CAP_ID_EXP): (
+        (0x00, 2, 'header'), (0x02, 2, 'flags'), (0x04, 4, 'devcap'), (0x08, 2, 'devctl'),
+        (0x0a, 2, 'devsta'), (0x0c, 4, 'lnkcap'), (0x10, 2, 'lnkctl'), (0x12, 2, 'lnksta'),
+        (0x14, 4, 'sltcap'), (0x18, 2, 'sltctl'), (0x1a, 2, 'sltsta'), (0x1c, 2, 'rtctl'),
+        (0x1e, 2, 'rtcap'), (0x20, 4, 'rtsta'), (0x24, 4, 'devcap2'), (0x28, 2, 'devctl2'),
+        (0x2a, 2, 'devsta2'), (0x2c, 4, 'lnkcap2'), (0x30, 2, 'lnkctl2'), (0x32, 2, 'lnksta2'),
+    ),
+    (True, lib.PCI_EXT_CAP_ID_AER): (
+        (0x00, 4, 'header'), (0x04, 4, 'uncor_status'), (0x08, 4, 'uncor_mask'),
+        (0x0c, 4, 'uncor_severity'), (0x10, 4, 'cor_status'), (0x14, 4, 'cor_mask'),
+        (0x18, 4, 'cap_control'), (0x1c, 16, 'header_log'), (0x2c, 4, 'root_command'),
+        (0x30, 4, 'root_status'), (0x34, 4, 'error_source'),
+    ),
+}
+
+# Bits that change on their own (RW1C error/event bits, status, logs), as
+# (offset, width, bits); configuration such as negotiated link speed/width stays compared.
+_VOLATILE_HEADER = ((0x06, 2, 0xf908),)
+_VOLATILE_BRIDGE = ((0x1e, 2, 0xf900),)
+_VOLATILE_CAP: Dict[Tuple[bool, int], Tuple[Tuple[int, int, int], ...]] = {
+    (False, lib.PCI_CAP_ID_EXP): (
+        (0x0a, 2, 0x006f),          # devsta: error bits, transactions pending, emergency power
+        (0x12, 2, 0xe800),          # lnksta: training, DLL active, bandwidth status
+        (0x1a, 2, 0x01ff),          # sltsta: events and presence/MRL state
+        (0x20, 4, 0x0003ffff),      # rtsta: PME requester, status, pending
+        (0x32, 2, 0x8020),          # lnksta2: equalization request, DRS received
+    ),
+    (True, lib.PCI_EXT_CAP_ID_AER): (
+        (0x04, 4, 0xffffffff), (0x10, 4, 0xffffffff), (0x1c, 16, (1 << 128) - 1),
+        (0x30, 4, 0xffffffff), (0x34, 4, 0xffffffff),
+    ),
+}
+
+
+class ConfigCap(NamedTuple):
+    extended: bool
+    id: int
+    addr: int
+
+    @property
+    def name(self) -> str:
+        try:
+            return (PciExtCapId if self.extended else PciCapId)(self.id).name
+        except ValueError:
+            return f'{"ext" if self.extended else "cap"}_{self.id:02x}'
+
+
+def parse_caps(config: bytes) -> List[ConfigCap]:
+    """Walk the normal and extended capability chains of a raw config space."""
+    ret = []
+    size = len(config)
+    if size >= 0x40 and config[0x06] & 0x10:
+        addr, seen = config[0x34] & ~3, set()
+        while 0x40 <= addr < min(size, 0x100) - 1 and addr not in seen:
+            seen.add(addr)
+            ret.append(ConfigCap(False, config[addr], addr))
+            addr = config[addr + 1] & ~3
+    addr, seen = 0x100, set()
+    while 0x100 <= addr <= size - 4 and addr not in seen:
+        seen.add(addr)
+        header, = struct.unpack_from('<I', config, addr)
+        if header in (0, 0xffffffff):
+            break
+        ret.append(ConfigCap(True, header & 0xffff, addr))
+        addr = (header >> 20) & ~3
+    return ret
+
+
+def _is_bridge(config: bytes) -> bool:
+    return len(config) > 0x0e and config[0x0e] & 0x7f == 1
+
+
+def register_name(config: bytes, offset: int, caps: Optional[List[ConfigCap]] = None) -> str:
+    """Name the register containing ``offset``, e.g. ``Exp.devctl+1`` or ``status``."""
+    def find(regs, base: int = 0) -> Optional[str]:
+        for off, width, name in regs:
+            if base + off <= offset < base + off + width:
+                rel = offset - base - off
+                return name if rel == 0 else f'{name}+{rel}'
+        return None
+
+    if offset < 0x40:
+        name = find(_HEADER) or find(_HEADER_BRIDGE if _is_bridge(config) else _HEADER_NORMAL)
+        return name or f'header+0x{offset:02x}'
+
+    if caps is None:
+        caps = parse_caps(config)
+    # the capability owning ``offset`` is the closest one starting at or below it
+    # within the same (normal/extended) region
+    owner = None
+    for cap in caps:
+        if cap.extended == (offset >= 0x100) and cap.addr <= offset and (owner is None or cap.addr > owner.addr):
+            owner = cap
+    if owner is None:
+        return f'0x{offset:03x}'
+    name = find(_CAP_REGS.get((owner.extended, owner.id), ()), owner.addr)
+    return f'{owner.name}.{name}' if name else f'{owner.name}+0x{offset - owner.addr:02x}'
+
+
+def volatile_mask(config: bytes, caps: Optional[List[ConfigCap]] = None, size: Optional[int] = None) -> np.ndarray:
+    """Bit mask (set = ignore) of status bits that change without configuration changes."""
+    size = len(config) if size is None else size
+    mask = np.zeros(size, dtype=np.uint8)
+    regs = list(_VOLATILE_HEADER)
+    if _is_bridge(config):
+        regs.extend(_VOLATILE_BRIDGE)
+    for cap in parse_caps(config) if caps is None else caps:
+        regs.extend((cap.addr + off, width, bits)
+                    for off, width, bits in _VOLATILE_CAP.get((cap.extended, cap.id), ()))
+    for off, width, bits in regs:
+        if off + width <= size:
+            mask[off:off + width] |= np.frombuffer(bits.to_bytes(width, 'little'), dtype=np.uint8)
+    return mask
+
+
+class Snapshot(NamedTuple):
+    """Config spaces of one host; ``data`` is ``(N, size)`` ``uint8``, rows sorted by BDF."""
+    slots: np.ndarray
+    data: np.ndarray
+
+    @property
+    def size(self) -> int:
+        return self.data.shape[1]
+
+    @property
+    def ids(self) -> np.ndarray:
+        """``(N, 2)`` array of (vendor_id, device_id) straight from the config data."""
+        return self.data[:, 0:4].copy().view('<u2').astype(np.int64)
+
+    def keys(self, by: str = 'bdf') -> List[tuple]:
+        """Alignment keys: ``'bdf'`` or ``'id'`` (vendor, device, slot, occurrence)."""
+        if by == 'bdf':
+            return [tuple(int(x) for x in row) for row in self.slots]
+        elif by == 'id':
+            ret, seen = [], {}
+            for (vid, did), (_, _, dev, func) in zip(self.ids, self.slots):
+                k = (int(vid), int(did), int(dev), int(func))
+                n = seen[k] = seen.get(k, -1) + 1
+                ret.append(k + (n,))
+            return ret
+        else:
+            raise ValueError(f'unknown alignment {by!r}')
+
+    def config(self, row: int) -> bytes:
+        return self.data[row].tobytes()
+
+    def save(self, file):
+        np.savez_compressed(file, slots=self.slots, data=self.data)
+
+    @classmethod
+    def load(cls, file) -> 'Snapshot':
+        with np.load(file) as f:
+            return cls(f['slots'], f['data'])
+
+    @classmethod
+    def from_configs(cls, configs: Iterable[Tuple[Tuple[int, int, int, int], bytes]],
+                     size: int = CONFIG_SPACE_SIZE) -> 'Snapshot':
+        configs = sorted(configs)
+        slots = np.array([slot for slot, _ in configs], dtype=np.int64).reshape(-1, 4)
+        data = np.zeros((len(configs), size), dtype=np.uint8)
+        for i, (_, config) in enumerate(configs):
+            n = min(size, len(config))
+            data[i, :n] = np.frombuffer(config, dtype=np.uint8, count=n)
+        return cls(slots, data)
+
+    @classmethod
+    def capture(cls, pci: 'pci.Pci', size: int = CONFIG_SPACE_SIZE) -> 'Snapshot':
+        pci.scan_bus()
+        return cls.from_configs((((dev.domain, dev.bus, dev.dev, dev.func), dev.read(0, size))
+                                 for dev in pci.devices), size)
+
+
+class ConfigDrift(NamedTuple):
+    host: int
+    key: tuple
+    offset: int
+    register: str
+    expected: int
+    actual: int
+
+
+def _align(golden: Dict[tuple, int], keys: Sequence[tuple]) -> Tuple[np.ndarray, np.ndarray]:
+    rows, golden_rows = [], []
+    for row, key in enumerate(keys):
+        g = golden.get(key)
+        if g is not None:
+            rows.append(row)
+            golden_rows.append(g)
+    return np.array(rows, dtype=np.intp), np.array(golden_rows, dtype=np.intp)
+
+
+def unmatched(golden: Snapshot, snapshot: Snapshot, by: str = 'bdf') -> Tuple[List[tuple], List[tuple]]:
+    """Keys missing from ``snapshot`` and keys only present in ``snapshot``."""
+    gk, sk = golden.keys(by), snapshot.keys(by)
+    gs, ss = set(gk), set(sk)
+    return [k for k in gk if k not in ss], [k for k in sk if k not in gs]
+
+
+def diff(golden: Snapshot, snapshots: Union[Snapshot, Sequence[Snapshot]], by: str = 'bdf',
+         ignore: Optional[np.ndarray] = None, ignore_volatile: bool = True,
+         chunk: int = 64) -> List[ConfigDrift]:
+    """Compare ``snapshots`` (one or many hosts) against ``golden``.
+
+    Hosts are aligned onto the golden rows and XORed ``chunk`` hosts at a time
+    as one ``(chunk, N, size)`` operation, so memory does not grow with fleet
+    size. ``ignore`` is a byte mask of bits to disregard, either ``(size,)`` for
+    every device or ``(N, size)`` per golden row.
+
+    Devices missing from a host are reported with ``register='<missing>'`` and
+    devices only present on a host with ``register='<extra>'``; both have
+    ``offset``, ``expected`` and ``actual`` set to -1.
+    """
+    if isinstance(snapshots, Snapshot):
+        snapshots = [snapshots]
+    size = min([golden.size] + [s.size for s in snapshots])
+    n = len(golden.data)
+    reference = golden.data[:, :size]
+
+    golden_keys = golden.keys(by)
+    golden_index = dict((k, i) for i, k in enumerate(golden_keys))
+
+    configs = [golden.config(i) for i in range(n)]
+    caps = [parse_caps(config) for config in configs]
+    mask = np.full((n, size), 0xff, dtype=np.uint8)
+    if ignore_volatile:
+        for i in range(n):
+            mask[i] &= ~volatile_mask(configs[i], caps[i])[:size]
+    if ignore is not None:
+        mask &= ~np.broadcast_to(np.asarray(ignore, dtype=np.uint8)[..., :size], (n, size))
+
+    ret = []
+    chunk = max(1, min(chunk, len(snapshots)))
+    stack = np.empty((chunk, n, size), dtype=np.uint8)
+    changed = np.empty_like(stack)
+    for first in range(0, len(snapshots), chunk):
+        hosts = snapshots[first:first + chunk]
+        count = len(hosts)
+        for h, snap in enumerate(hosts):
+            keys = snap.keys(by)
+            rows, golden_rows = _align(golden_index, keys)
+            # unmatched golden rows compare equal; they are reported as missing below
+            stack[h] = reference
+            stack[h, golden_rows] = snap.data[rows, :size]
+
+            present = set(golden_rows.tolist())
+            ret.extend(ConfigDrift(first + h, key, -1, '<missing>', -1, -1)
+                       for i, key in enumerate(golden_keys) if i not in present)
+            ret.extend(ConfigDrift(first + h, key, -1, '<extra>', -1, -1)
+                       for key in keys if key not in golden_index)
+
+        diffs = stack[:count]
+        np.bitwise_xor(diffs, reference[None], out=diffs)
+        np.bitwise_and(diffs, mask[None], out=changed[:count])
+        for h, row, off in zip(*(x.tolist() for x in np.nonzero(changed[:count]))):
+            expected = int(reference[row, off])
+            ret.append(ConfigDrift(first + h, golden_keys[row], off, register_name(configs[row], off, caps[row]),
+                                   expected, expected ^ int(diffs[h, row, off])))
+    ret.sort(key=lambda d: d.host)
+    return ret
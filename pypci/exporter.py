@@ -0,0 +1,226 @@
+"""Prometheus exporter for PCIe link, device status and AER state.
+
+Hardware is only touched by the collector thread, on its own schedule. Scrapes
+are served from the last rendered payload, so any number of concurrent scrapers
+costs no extra config-space reads. The bus is scanned once at start-up and
+again only when :meth:`PciExporter.rescan` is called (``POST /-/rescan`` or
+``SIGHUP`` when run as a script).
+"""
+from ._native import lib
+from .pci import Pci
+from .device import PciDevice, PciFillFlag, PciCapType
+from .regmap import RegisterMap, Field, PCIE_CAP, AER_STATUS
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+import argparse
+import logging
+import signal
+import sys
+import threading
+import time
+
+
+_log = logging.getLogger(__name__)
+
+_LINK_SPEEDS = {1: 2.5, 2: 5.0, 3: 8.0, 4: 16.0, 5: 32.0, 6: 64.0}
+
+_STATUS = RegisterMap('Status', vendor_id=Field(0x00, 2), status=Field(lib.PCI_STATUS, 2))
+
+_METRICS: Tuple[Tuple[str, str], ...] = (
+    ('pci_status', 'PCI status register.'),
+    ('pcie_device_status', 'PCIe device status register.'),
+    ('pcie_link_speed_gts', 'Current PCIe link speed in GT/s.'),
+    ('pcie_link_max_speed_gts', 'Maximum PCIe link speed in GT/s.'),
+    ('pcie_link_width', 'Negotiated PCIe link width.'),
+    ('pcie_link_max_width', 'Maximum PCIe link width.'),
+    ('pcie_aer_uncorrectable_status', 'AER uncorrectable error status register.'),
+    ('pcie_aer_correctable_status', 'AER correctable error status register.'),
+)
+
+
+class _Target(NamedTuple):
+    device: PciDevice
+    labels: str
+    exp: Optional[int]
+    aer: Optional[int]
+
+
+class PciExporter:
+    def __init__(self, pci_factory: Callable[[], Pci] = Pci, interval: float = 15.0):
+        self._pci_factory = pci_factory
+        self._pci: Optional[Pci] = None
+        self.interval = interval
+        self._targets: List[_Target] = []
+        self._payload = b''
+        self._payload_lock = threading.Lock()
+        self._rescan = threading.Event()
+        self._rescan.set()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def payload(self) -> bytes:
+        with self._payload_lock:
+            return self._payload
+
+    def rescan(self):
+        """Request a bus rescan before the next collection and collect right away."""
+        self._rescan.set()
+        self._wake.set()
+
+    def _close(self):
+        # devices must be freed before the access they were allocated from
+        for t in self._targets:
+            t.device.close()
+        self._targets = []
+        if self._pci is not None:
+            self._pci.close()
+            self._pci = None
+
+    def _scan(self):
+        # pci_scan_bus appends to the access' device list, so start from a fresh one
+        self._close()
+        self._pci = self._pci_factory()
+        self._pci.scan_bus()
+        flags = PciFillFlag.Ident | PciFillFlag.Caps
+        if 'ExtCaps' in PciFillFlag.__members__:
+            flags |= PciFillFlag.ExtCaps
+        targets = []
+        for dev in self._pci.devices:
+            dev.fill_info(flags)
+            exp = aer = None
+            for cap in dev.caps:
+                if cap.type == PciCapType.Normal and cap.id == lib.PCI_CAP_ID_EXP:
+                    exp = cap.addr
+                elif cap.type == PciCapType.Extended and cap.id == lib.PCI_EXT_CAP_ID_AER:
+                    aer = cap.addr
+            labels = f'slot="{dev.domain:04x}:{dev.bus:02x}:{dev.dev:02x}.{dev.func:x}",' \
+                     f'vendor_id="{dev._dev.vendor_id:04x}",device_id="{dev._dev.device_id:04x}"'
+            targets.append(_Target(dev, labels, exp, aer))
+        self._targets = targets
+
+    def collect(self) -> bytes:
+        """Read every target once and render the exposition payload."""
+        if self._rescan.is_set():
+            self._rescan.clear()
+            self._scan()
+
+        start = time.time()
+        samples: Dict[str, List[str]] = dict((name, []) for name, _ in _METRICS)
+        for t in self._targets:
+            dev = t.device
+            header = _STATUS.read(dev)
+            # removed devices read as all ones from hardware, or zeros when the sysfs read fails
+            if header.vendor_id in (0, 0xffff):
+                continue
+            samples['pci_status'].append(f'{{{t.labels}}} {header.status}')
+            if t.exp is not None:
+                exp = PCIE_CAP.read(dev, t.exp)
+                samples['pcie_device_status'].append(f'{{{t.labels}}} {exp.device_status}')
+                samples['pcie_link_speed_gts'].append(f'{{{t.labels}}} {_LINK_SPEEDS.get(exp.link_speed, 0.0)}')
+                samples['pcie_link_max_speed_gts'].append(
+                    f'{{{t.labels}}} {_LINK_SPEEDS.get(exp.link_max_speed, 0.0)}')
+                samples['pcie_link_width'].append(f'{{{t.labels}}} {exp.link_width}')
+                samples['pcie_link_max_width'].append(f'{{{t.labels}}} {exp.link_max_width}')
+            if t.aer is not None:
+                aer = AER_STATUS.read(dev, t.aer)
+                samples['pcie_aer_uncorrectable_status'].append(f'{{{t.labels}}} {aer.uncorrectable_status}')
+                samples['pcie_aer_correctable_status'].append(f'{{{t.labels}}} {aer.correctable_status}')
+        end = time.time()
+
+        lines = []
+        for name, help in _METRICS:
+            lines.append(f'# HELP {name} {help}')
+            lines.append(f'# TYPE {name} gauge')
+            lines.extend(name + sample for sample in samples[name])
+        lines.append('# HELP pci_exporter_collect_duration_seconds Time spent reading config space.')
+        lines.append('# TYPE pci_exporter_collect_duration_seconds gauge')
+        lines.append(f'pci_exporter_collect_duration_seconds {end - start}')
+        lines.append('# HELP pci_exporter_last_collect_timestamp_seconds Time of the last collection.')
+        lines.append('# TYPE pci_exporter_last_collect_timestamp_seconds gauge')
+        lines.append(f'pci_exporter_last_collect_timestamp_seconds {end}')
+        payload = ('\n'.join(lines) + '\n').encode('utf-8')
+
+        with self._payload_lock:
+            self._payload = payload
+        return payload
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.collect()
+            except Exception:
+                _log.exception('collection failed')
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def start(self):
+        if self._thread is None:
+            self.collect()
+            self._thread = threading.Thread(target=self._run, name='pypci-exporter', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._close()
+
+    def serve(self, host: str = '127.0.0.1', port: int = 9436) -> ThreadingHTTPServer:
+        """Start collecting and return an HTTP server serving the cached payload."""
+        exporter = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != '/metrics':
+                    self.send_error(404)
+                    return
+                payload = exporter.payload
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_POST(self):
+                if self.path != '/-/rescan':
+                    self.send_error(404)
+                    return
+                exporter.rescan()
+                self.send_response(202)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        self.start()
+        return ThreadingHTTPServer((host, port), Handler)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog='pypci-exporter', description='Prometheus exporter for PCIe state')
+    parser.add_argument('--host', default='127.0.0.1', help='address to listen on (default: %(default)s)')
+    parser.add_argument('--port', type=int, default=9436, help='port to listen on (default: %(default)s)')
+    parser.add_argument('--interval', type=float, default=15.0,
+                        help='seconds between collections (default: %(default)s)')
+    args = parser.parse_args(argv)
+
+    exporter = PciExporter(interval=args.interval)
+    signal.signal(signal.SIGHUP, lambda signum, frame: exporter.rescan())
+    server = exporter.serve(args.host, args.port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        exporter.stop()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -91,7 +91,9 @@ class PciFilter:
     @slot_filter.setter
     def slot_filter(self, val: str):
         val_ = val.encode('utf-8') + b'\0'
-        lib.pci_filter_parse_slot(self._filt, ffi.from_buffer(val_))
+        err = lib.pci_filter_parse_slot(self._filt, ffi.from_buffer(val_))
+        if err != ffi.NULL:
+            raise ValueError(f'{val}: {ffi.string(err).decode("utf-8")}')
 
     @property
     def id_filter(self) -> str:
@@ -103,7 +105,9 @@ class PciFilter:
     @id_filter.setter
     def id_filter(self, val: str):
         val_ = val.encode('utf-8') + b'\0'
-        lib.pci_filter_parse_id(self._filt, ffi.from_buffer(val_))
+        err = lib.pci_filter_parse_id(self._filt, ffi.from_buffer(val_))
+        if err != ffi.NULL:
+            raise ValueError(f'{val}: {ffi.string(err).decode("utf-8")}')
 
     def __contains__(self, dev: PciDevice) -> bool:
         return lib.pci_filter_match(self._filt, dev._dev) != 0
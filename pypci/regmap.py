@@ -0,0 +1,161 @@
+from .device import PciDevice
+from typing import NamedTuple, Optional, Sequence, Tuple, Union
+import collections
+import numbers
+import struct
+
+
+class Field(NamedTuple):
+    """``width`` bytes at ``offset``; ``bits`` is an inclusive ``(high, low)`` range as in datasheets."""
+    offset: int
+    width: int = 4
+    bits: Optional[Tuple[int, int]] = None
+
+
+_FORMATS = {1: 'B', 2: 'H', 4: 'I', 8: 'Q'}
+
+
+class RegisterMap:
+    """Declarative register map compiled to a single block read.
+
+    The covering span of all fields is read with one ``pci_read_block`` and
+    decoded with a precomputed ``struct`` format plus shift/mask pairs::
+
+        LINK = RegisterMap('Link', speed=Field(0x12, 2, (3, 0)), width=Field(0x12, 2, (9, 4)))
+        LINK.read(device, pcie_cap_addr)
+    """
+
+    def __init__(self, name: str, /, **fields: Union[Field, Tuple]):
+        if not fields:
+            raise ValueError("register map needs at least one field")
+        fields_ = dict((k, v if isinstance(v, Field) else Field(*v)) for k, v in fields.items())
+        for k, f in fields_.items():
+            if f.width not in _FORMATS:
+                raise ValueError(f"{k}: width must be one of {sorted(_FORMATS)}")
+            if f.bits is not None and not (0 <= f.bits[1] <= f.bits[0] < f.width * 8):
+                raise ValueError(f"{k}: bits {f.bits} out of range for a {f.width}-byte register")
+
+        self.name = name
+        self.fields = fields_
+        self.start = min(f.offset for f in fields_.values())
+        self.end = max(f.offset + f.width for f in fields_.values())
+        self.type = collections.namedtuple(name, fields_)
+
+        self._regs = sorted(set((f.offset - self.start, f.width) for f in fields_.values()))
+        index = dict((reg, i) for i, reg in enumerate(self._regs))
+        self._ops = []
+        for f in fields_.values():
+            i = index[(f.offset - self.start, f.width)]
+            if f.bits is None:
+                self._ops.append((i, 0, (1 << (f.width * 8)) - 1))
+            else:
+                high, low = f.bits
+                self._ops.append((i, low, (1 << (high - low + 1)) - 1))
+
+        overlapping = any(a + w > b for (a, w), (b, _) in zip(self._regs, self._regs[1:]))
+        if overlapping:
+            self._struct = None
+            self._unpackers = [(struct.Struct('<' + _FORMATS[w]), off) for off, w in self._regs]
+        else:
+            fmt, pos = '<', 0
+            for off, w in self._regs:
+                if off > pos:
+                    fmt += f'{off - pos}x'
+                fmt += _FORMATS[w]
+                pos = off + w
+            self._struct = struct.Struct(fmt)
+
+    @property
+    def span(self) -> int:
+        return self.end - self.start
+
+    def _unpack(self, data, offset: int) -> Tuple[int, ...]:
+        if self._struct is not None:
+            return self._struct.unpack_from(data, offset)
+        return tuple(s.unpack_from(data, offset + off)[0] for s, off in self._unpackers)
+
+    def decode(self, data: bytes, offset: int = 0):
+        """Decode a buffer holding the covering span at ``offset``."""
+        regs = self._unpack(data, offset)
+        return self.type(*[(regs[i] >> shift) & mask for i, shift, mask in self._ops])
+
+    def read(self, device: PciDevice, base: int = 0):
+        return self.decode(device.read(base + self.start, self.span))
+
+    def read_many(self, devices: Sequence[PciDevice], bases: Union[int, Sequence[int]] = 0):
+        """Decode the map across ``devices`` at once; every field becomes a numpy array.
+
+        ``bases`` is a single base offset or one per device. Requires numpy.
+        """
+        import numpy as np
+
+        n, span = len(devices), self.span
+        if isinstance(bases, numbers.Integral):
+            bases = [int(bases)] * n
+        elif len(bases) != n:
+            raise ValueError("bases must have one entry per device")
+
+        if n == 0:
+            return self.type(*[np.zeros(0, dtype=np.uint64) for _ in self._ops])
+
+        buf = bytearray(n * span)
+        for i, (dev, base) in enumerate(zip(devices, bases)):
+            buf[i * span:(i + 1) * span] = dev.read(int(base) + self.start, span)
+
+        # strided zero-copy views of each register over all rows
+        regs = [np.ndarray((n,), dtype=f'<u{w}', buffer=buf, offset=off, strides=(span,)).astype(np.uint64)
+                for off, w in self._regs]
+        return self.type(*[(regs[i] >> np.uint64(shift)) & np.uint64(mask) for i, shift, mask in self._ops])
+
+
+HEADER = RegisterMap(
+    'PciHeader',
+    vendor_id=Field(0x00, 2),
+    device_id=Field(0x02, 2),
+    command=Field(0x04, 2),
+    status=Field(0x06, 2),
+    revision_id=Field(0x08, 1),
+    prog_if=Field(0x09, 1),
+    class_id=Field(0x0a, 2),
+    header_type=Field(0x0e, 1, (6, 0)),
+    multifunction=Field(0x0e, 1, (7, 7)),
+    cap_ptr=Field(0x34, 1),
+    interrupt_line=Field(0x3c, 1),
+    interrupt_pin=Field(0x3d, 1),
+)
+
+# Offsets relative to the PCI Express capability.
+PCIE_CAP = RegisterMap(
+    'PcieCap',
+    version=Field(0x02, 2, (3, 0)),
+    port_type=Field(0x02, 2, (7, 4)),
+    max_payload_supported=Field(0x04, 4, (2, 0)),
+    max_payload=Field(0x08, 2, (7, 5)),
+    max_read_request=Field(0x08, 2, (14, 12)),
+    device_status=Field(0x0a, 2),
+    link_max_speed=Field(0x0c, 4, (3, 0)),
+    link_max_width=Field(0x0c, 4, (9, 4)),
+    aspm_support=Field(0x0c, 4, (11, 10)),
+    aspm_control=Field(0x10, 2, (1, 0)),
+    link_speed=Field(0x12, 2, (3, 0)),
+    link_width=Field(0x12, 2, (9, 4)),
+)
+
+# Offsets relative to the MSI-X capability; table/pba hold the BIR in bits 2:0.
+MSIX_CAP = RegisterMap(
+    'MsixCap',
+    table_size=Field(0x02, 2, (10, 0)),
+    function_mask=Field(0x02, 2, (14, 14)),
+    enable=Field(0x02, 2, (15, 15)),
+    table=Field(0x04, 4),
+    table_bir=Field(0x04, 4, (2, 0)),
+    pba=Field(0x08, 4),
+    pba_bir=Field(0x08, 4, (2, 0)),
+)
+
+# Offsets relative to the AER extended capability.
+AER_STATUS = RegisterMap(
+    'AerStatus',
+    uncorrectable_status=Field(0x04, 4),
+    correctable_status=Field(0x10, 4),
+)
@@ -9,6 +9,13 @@ setup(
     maintainer='gwangyi',
     author_email='gwangyi.kr@gmail.com',
     packages=['pypci'],
+    python_requires='>=3.8',
+    entry_points={
+        'console_scripts': [
+            'pypci=pypci.cli:main',
+            'pypci-exporter=pypci.exporter:main',
+        ],
+    },
     classifiers=[
         'Development Status :: 4 - Beta',
         'Programming Language :: Python :: 3',
@@ -16,6 +23,9 @@ setup(
     setup_requires=['cffi>=1.0.0', 'pycparserlibc', 'cffi_ext'],
     cffi_modules=['build.py:ffi_builder'],
     install_requires=['cffi>=1.0.0'],
+    extras_require={
+        'drift': ['numpy'],
+    },
     dependency_links=[
         'git+https://github.com/gwangyi/pycparserlibc#egg=pycparserlibc-0',
         'git+https://github.com/gwangyi/cffi_ext#egg=cffi_ext-0'
@@ -0,0 +1,105 @@
+import struct
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from pypci.drift import Snapshot, diff, parse_caps, register_name, unmatched  # noqa: E402
+
+EXP = 0x40
+AER = 0x100
+
+
+def make_config(devctl=0x2810, lnksta=0x1043, status=0x10, uncor=0, vendor=0x8086, device=0x1234):
+    c = bytearray(4096)
+    struct.pack_into('<HHHH', c, 0, vendor, device, 0x0006, status)
+    c[0x34] = EXP
+    c[EXP], c[EXP + 1] = 0x10, 0x00
+    struct.pack_into('<H', c, EXP + 0x08, devctl)
+    struct.pack_into('<H', c, EXP + 0x12, lnksta)
+    struct.pack_into('<I', c, AER, 0x00010001)
+    struct.pack_into('<I', c, AER + 0x04, uncor)
+    return bytes(c)
+
+
+def snapshot(*devices):
+    return Snapshot.from_configs(devices)
+
+
+def test_parse_caps():
+    caps = parse_caps(make_config())
+    assert [(c.extended, c.id, c.addr) for c in caps] == [(False, 0x10, EXP), (True, 0x01, AER)]
+
+
+def test_parse_caps_without_cap_list():
+    assert parse_caps(make_config(status=0)[:0x100]) == []
+
+
+def test_register_name():
+    config = make_config()
+    assert register_name(config, 0x06) == 'status'
+    assert register_name(config, 0x11) == 'bar0+1'
+    assert register_name(config, EXP + 0x09) == 'Exp.devctl+1'
+    assert register_name(config, AER + 0x04).endswith('.uncor_status')
+
+
+def test_diff_reports_changed_register():
+    golden = snapshot(((0, 1, 0, 0), make_config()))
+    host = snapshot(((0, 1, 0, 0), make_config(devctl=0x2830)))
+    d, = diff(golden, host)
+    assert (d.host, d.key, d.offset, d.register) == (0, (0, 1, 0, 0), EXP + 0x08, 'Exp.devctl')
+    assert (d.expected, d.actual) == (0x10, 0x30)
+
+
+def test_diff_ignores_volatile_bits_only():
+    golden = snapshot(((0, 1, 0, 0), make_config()))
+    volatile = snapshot(((0, 1, 0, 0), make_config(lnksta=0x3043, status=0x8010, uncor=0x20)))
+    assert diff(golden, volatile) == []
+    assert len(diff(golden, volatile, ignore_volatile=False)) == 3
+
+    downtrained = snapshot(((0, 1, 0, 0), make_config(lnksta=0x1021)))
+    assert [d.register for d in diff(golden, downtrained)] == ['Exp.lnksta']
+
+
+def test_diff_ignore_mask():
+    golden = snapshot(((0, 1, 0, 0), make_config()))
+    host = snapshot(((0, 1, 0, 0), make_config(devctl=0x2830)))
+    ignore = np.zeros(4096, dtype=np.uint8)
+    ignore[EXP + 0x08] = 0x20
+    assert diff(golden, host, ignore=ignore) == []
+
+
+def test_diff_missing_and_extra():
+    golden = snapshot(((0, 1, 0, 0), make_config()))
+    host = snapshot(((0, 2, 0, 0), make_config()))
+    assert [(d.register, d.key) for d in diff(golden, host)] == \
+        [('<missing>', (0, 1, 0, 0)), ('<extra>', (0, 2, 0, 0))]
+    assert unmatched(golden, host) == ([(0, 1, 0, 0)], [(0, 2, 0, 0)])
+
+
+def test_diff_align_by_id():
+    golden = snapshot(((0, 1, 0, 0), make_config()))
+    host = snapshot(((0, 2, 0, 0), make_config(devctl=0x2830)))
+    d, = diff(golden, host, by='id')
+    assert d.key == (0x8086, 0x1234, 0, 0, 0)
+    assert d.register == 'Exp.devctl'
+
+
+def test_diff_across_chunks():
+    golden = snapshot(((0, 1, 0, 0), make_config()), ((0, 2, 0, 0), make_config(device=0x5678)))
+    same = snapshot(((0, 1, 0, 0), make_config()), ((0, 2, 0, 0), make_config(device=0x5678)))
+    changed = snapshot(((0, 1, 0, 0), make_config()), ((0, 2, 0, 0), make_config(device=0x5678, devctl=0x2830)))
+    partial = snapshot(((0, 1, 0, 0), make_config()))
+    hosts = [same, changed, partial, changed, same]
+
+    expected = diff(golden, hosts, chunk=len(hosts))
+    for chunk in (1, 2, 3):
+        assert diff(golden, hosts, chunk=chunk) == expected
+    assert [(d.host, d.register) for d in expected] == \
+        [(1, 'Exp.devctl'), (2, '<missing>'), (3, 'Exp.devctl')]
+
+
+def test_snapshot_save_load(tmp_path):
+    snap = snapshot(((0, 1, 0, 0), make_config()))
+    snap.save(tmp_path / 'snap.npz')
+    loaded = Snapshot.load(tmp_path / 'snap.npz')
+    assert (loaded.slots == snap.slots).all() and (loaded.data == snap.data).all()
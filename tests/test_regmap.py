@@ -0,0 +1,74 @@
+import struct
+import pytest
+
+from pypci.regmap import RegisterMap, Field, PCIE_CAP
+
+
+class FakeDevice:
+    def __init__(self, config: bytes):
+        self.config = config
+        self.reads = []
+
+    def read(self, pos: int, len: int) -> bytes:
+        self.reads.append((pos, len))
+        return self.config[pos:pos + len]
+
+
+def make_config(lnksta=0x1043, lnkcap=0x0044):
+    c = bytearray(256)
+    struct.pack_into('<HH', c, 0, 0x8086, 0x1234)
+    struct.pack_into('<I', c, 0x40 + 0x0c, lnkcap)
+    struct.pack_into('<H', c, 0x40 + 0x12, lnksta)
+    return bytes(c)
+
+
+def test_bit_ranges():
+    m = RegisterMap('Link', speed=Field(0x12, 2, (3, 0)), width=Field(0x12, 2, (9, 4)),
+                    training=Field(0x12, 2, (11, 11)))
+    assert m.start == 0x12 and m.span == 2
+    dev = FakeDevice(make_config(lnksta=0x0843))
+    assert m.read(dev, 0x40) == m.type(speed=3, width=4, training=1)
+    assert dev.reads == [(0x52, 2)]
+
+
+def test_single_block_read():
+    dev = FakeDevice(make_config())
+    link = PCIE_CAP.read(dev, 0x40)
+    assert (link.link_speed, link.link_width, link.link_max_speed, link.link_max_width) == (3, 4, 4, 4)
+    assert dev.reads == [(0x40 + PCIE_CAP.start, PCIE_CAP.span)]
+
+
+def test_overlapping_registers():
+    m = RegisterMap('Overlap', whole=Field(0, 4), high=Field(2, 2), top=Field(2, 2, (15, 8)))
+    assert m._struct is None
+    data = struct.pack('<I', 0x12345678)
+    assert m.decode(data) == m.type(whole=0x12345678, high=0x1234, top=0x12)
+
+
+def test_field_named_name():
+    m = RegisterMap('Named', name=Field(0, 2))
+    assert m.decode(b'\x86\x80').name == 0x8086
+
+
+def test_invalid_fields():
+    with pytest.raises(ValueError):
+        RegisterMap('Empty')
+    with pytest.raises(ValueError):
+        RegisterMap('Width', x=Field(0, 3))
+    with pytest.raises(ValueError):
+        RegisterMap('Bits', x=Field(0, 1, (8, 0)))
+
+
+def test_read_many():
+    np = pytest.importorskip('numpy')
+    devs = [FakeDevice(make_config(lnksta=0x1043)), FakeDevice(make_config(lnksta=0x1021))]
+    ret = PCIE_CAP.read_many(devs, np.int64(0x40))
+    assert ret.link_width.tolist() == [4, 2]
+    assert ret.link_speed.tolist() == [3, 1]
+    assert [d.reads for d in devs] == [[(0x40 + PCIE_CAP.start, PCIE_CAP.span)]] * 2
+
+    ret = PCIE_CAP.read_many(devs, [0x40, 0x40])
+    assert ret.link_width.tolist() == [4, 2]
+    assert PCIE_CAP.read_many([]).link_width.tolist() == []
+    with pytest.raises(ValueError):
+        PCIE_CAP.read_many(devs, [0x40])